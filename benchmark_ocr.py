@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark de vazão do pool de OCR
+Renderiza os recibos de fixtures/recibos.json como imagens e mede quantos
+recibos por segundo o PoolOCR processa com diferentes números de processos
+
+Uso: python3 benchmark_ocr.py [--processos 1 2 4] [--repeticoes 5]
+"""
+
+import io
+import os
+import json
+import time
+import asyncio
+import argparse
+from typing import Dict, Any, List, Tuple
+
+from recibos import PoolOCR
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'recibos.json')
+
+
+def renderizar_recibo(linhas: List[str]) -> bytes:
+    """
+    Gera a imagem PNG de um recibo a partir das suas linhas
+
+    Args:
+        linhas: Linhas de texto do recibo
+
+    Returns:
+        bytes: Imagem PNG
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    fonte = ImageFont.load_default(size=28)
+    altura_linha = 40
+    imagem = Image.new('L', (900, altura_linha * (len(linhas) + 2)), color=255)
+    desenho = ImageDraw.Draw(imagem)
+    for i, linha in enumerate(linhas, start=1):
+        desenho.text((30, i * altura_linha), linha, font=fonte, fill=0)
+
+    saida = io.BytesIO()
+    imagem.save(saida, format='PNG')
+    return saida.getvalue()
+
+
+def carregar_fixtures() -> List[Tuple[Dict[str, Any], bytes]]:
+    """Carrega os recibos de exemplo já renderizados"""
+    with open(FIXTURES, 'r', encoding='utf-8') as f:
+        recibos = json.load(f)
+    return [(recibo, renderizar_recibo(recibo['linhas'])) for recibo in recibos]
+
+
+def campos_corretos(resultado: Dict[str, Any], esperado: Dict[str, Any]) -> int:
+    """Quantidade de campos extraídos iguais ao esperado"""
+    return sum(1 for campo, valor in esperado.items() if resultado.get(campo) == valor)
+
+
+async def medir(processos: int, fixtures: List[Tuple[Dict[str, Any], bytes]], repeticoes: int) -> Dict[str, Any]:
+    """
+    Processa todas as fixtures `repeticoes` vezes com um pool de `processos`
+
+    Returns:
+        dict: recibos processados, tempo, vazão e acerto dos campos
+    """
+    lote = fixtures * repeticoes
+    pool = PoolOCR(processos, fila_maxima=len(lote))
+    try:
+        # Aquecimento: sobe os processos antes de medir
+        await asyncio.gather(*(pool.processar(conteudo) for _, conteudo in fixtures[:processos]))
+
+        inicio = time.perf_counter()
+        resultados = await asyncio.gather(*(pool.processar(conteudo) for _, conteudo in lote))
+        duracao = time.perf_counter() - inicio
+    finally:
+        pool.encerrar()
+
+    acertos = sum(campos_corretos(r, recibo['esperado']) for (recibo, _), r in zip(lote, resultados))
+    total_campos = sum(len(recibo['esperado']) for recibo, _ in lote)
+
+    return {
+        'processos': processos,
+        'recibos': len(lote),
+        'segundos': duracao,
+        'recibos_por_segundo': len(lote) / duracao,
+        'acerto': acertos / total_campos,
+    }
+
+
+def main() -> None:
+    """Função principal"""
+    parser = argparse.ArgumentParser(description='Benchmark de vazão do pool de OCR')
+    parser.add_argument('--processos', type=int, nargs='+', default=[1, 2, os.cpu_count() or 1])
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    fixtures = carregar_fixtures()
+    print(f"{len(fixtures)} recibos de exemplo x {args.repeticoes} repetições\n")
+    print(f"{'processos':>9} {'recibos':>8} {'tempo (s)':>10} {'recibos/s':>10} {'acerto':>7}")
+
+    for processos in sorted(set(args.processos)):
+        r = asyncio.run(medir(processos, fixtures, args.repeticoes))
+        print(f"{r['processos']:>9} {r['recibos']:>8} {r['segundos']:>10.2f} "
+              f"{r['recibos_por_segundo']:>10.2f} {r['acerto']:>7.0%}")
+
+
+if __name__ == '__main__':
+    main()
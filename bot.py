@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 
 import os
+import signal
+import asyncio
 import logging
 import json
 from datetime import datetime
@@ -9,8 +11,15 @@ from typing import Dict, Any
 from dotenv import load_dotenv
 
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
+from telegram.helpers import escape_markdown
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler, CallbackQueryHandler
 
+from preferencias_usuario import ModeloPreferencias
+from sessoes import ControleEnvios, EnvioInterrompido, criar_persistencia, restaurar_rascunhos
+from google_forms_integration import TIMEOUT_ENVIO
+from recibos import PoolOCR, FilaOCRCheia, OCRInterrompido
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
@@ -24,9 +33,17 @@ logger = logging.getLogger(__name__)
 # Token do bot
 TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 GOOGLE_FORM_URL = os.getenv('GOOGLE_FORM_URL')
+PREFERENCIAS_FILE = os.getenv('PREFERENCIAS_FILE', 'preferencias_usuarios.json')
+PREFERENCIAS_INTERVALO = float(os.getenv('PREFERENCIAS_INTERVALO', '60'))
+SESSOES_FILE = os.getenv('SESSOES_FILE', 'sessoes.pickle')
+# Deve ser maior que o pior caso de um envio (conexão + leitura)
+PRAZO_ENCERRAMENTO = float(os.getenv('PRAZO_ENCERRAMENTO', '25'))
+OCR_PROCESSOS = int(os.getenv('OCR_PROCESSOS', '2'))
+OCR_FILA_MAXIMA = int(os.getenv('OCR_FILA_MAXIMA', '8'))
+OCR_IDIOMA = os.getenv('OCR_IDIOMA', 'por')
 
 # Estados da conversa
-TIPO_LANCAMENTO, VALOR, CATEGORIA, DESCRICAO, DATA = range(5)
+TIPO_LANCAMENTO, VALOR, CATEGORIA, DESCRICAO, DATA, CATEGORIA_RECIBO = range(6)
 
 # Dados do formulário
 TIPOS_LANCAMENTO = [
@@ -45,6 +62,15 @@ CATEGORIAS = [
 # Armazenamento temporário de dados do usuário
 user_data_storage = {}
 
+# Preferências aprendidas (ordem dos teclados e sugestão de categoria)
+modelo_preferencias = ModeloPreferencias(TIPOS_LANCAMENTO, CATEGORIAS, PREFERENCIAS_FILE)
+
+# Envios ao Google Forms em andamento (drenados no desligamento)
+controle_envios = ControleEnvios()
+
+# Processos de OCR para leitura de recibos
+pool_ocr = PoolOCR(OCR_PROCESSOS, OCR_FILA_MAXIMA, OCR_IDIOMA)
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Comando /start - Apresenta o bot"""
     welcome_message = """
@@ -83,6 +109,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 2. Siga as instruções passo a passo
 3. Confirme os dados antes do envio
 
+Você também pode enviar a foto ou o PDF de um recibo para preenchimento automático.
+
 *Tipos de lançamento disponíveis:*
 • Entrada • Empréstimo • Despesa Débito
 • Despesa Crédito • Despesa Pix • Saldo
@@ -97,11 +125,8 @@ async def novo_lancamento(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user_id = update.effective_user.id
     user_data_storage[user_id] = {}
     
-    # Criar teclado com tipos de lançamento
-    keyboard = []
-    for i in range(0, len(TIPOS_LANCAMENTO), 2):
-        row = TIPOS_LANCAMENTO[i:i+2]
-        keyboard.append(row)
+    # Criar teclado com tipos de lançamento (mais usados primeiro)
+    keyboard = modelo_preferencias.teclado_tipos(user_id)
     
     reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
     
@@ -150,11 +175,10 @@ async def receber_valor(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         
         user_data_storage[user_id]['valor'] = valor
         
-        # Criar teclado com categorias (3 por linha)
-        keyboard = []
-        for i in range(0, len(CATEGORIAS), 3):
-            row = CATEGORIAS[i:i+3]
-            keyboard.append(row)
+        # Criar teclado com categorias (3 por linha, mais usadas primeiro)
+        keyboard = modelo_preferencias.teclado_categorias(
+            user_id, user_data_storage[user_id].get('tipo_lancamento')
+        )
         
         reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
         
@@ -203,13 +227,34 @@ async def receber_descricao(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     user_data_storage[user_id]['descricao'] = descricao
     
-    await update.message.reply_text(
-        f"✅ Descrição registrada: *{descricao}*\n\n"
+    mensagem = (
+        f"✅ Descrição registrada: {escape_markdown(descricao)}\n\n"
         "**5/5** - Digite a data do lançamento ou envie 'hoje' para usar a data atual:\n"
-        "Formato: DD/MM/AAAA ou 'hoje'",
+        "Formato: DD/MM/AAAA ou 'hoje'"
+    )
+    reply_markup = None
+    
+    # Sugerir a categoria que o usuário costuma usar para essa descrição
+    sugestao = modelo_preferencias.sugerir_categoria(user_id, descricao)
+    if sugestao and sugestao != user_data_storage[user_id].get('categoria'):
+        mensagem += f"\n\n💡 Essa descrição costuma ser da categoria *{sugestao}*."
+        reply_markup = InlineKeyboardMarkup([[
+            InlineKeyboardButton(
+                f"Usar {sugestao}",
+                callback_data=f"sugestao_categoria:{CATEGORIAS.index(sugestao)}"
+            )
+        ]])
+    
+    resposta = await update.message.reply_text(
+        mensagem,
+        reply_markup=reply_markup,
         parse_mode='Markdown'
     )
     
+    if reply_markup:
+        # O botão só vale para esta mensagem e enquanto a data não for enviada
+        user_data_storage[user_id]['sugestao_mensagem'] = resposta.message_id
+    
     return DATA
 
 async def receber_data(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -233,15 +278,31 @@ async def receber_data(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     
     user_data_storage[user_id]['data'] = data
     
-    # Mostrar resumo e pedir confirmação
-    dados = user_data_storage[user_id]
+    # Expirar o botão de sugestão de categoria, se houver
+    sugestao_mensagem = user_data_storage[user_id].pop('sugestao_mensagem', None)
+    if sugestao_mensagem:
+        try:
+            await context.bot.edit_message_reply_markup(
+                chat_id=update.effective_chat.id,
+                message_id=sugestao_mensagem,
+                reply_markup=None
+            )
+        except TelegramError as e:
+            logger.warning(f"Não foi possível remover o botão de sugestão: {e}")
+    
+    await enviar_resumo(update, user_data_storage[user_id])
+    
+    return ConversationHandler.END
+
+async def enviar_resumo(update: Update, dados: Dict[str, Any]) -> None:
+    """Mostra o resumo da transação e pede confirmação"""
     resumo = f"""
 📋 *Resumo da Transação*
 
 • **Tipo:** {dados['tipo_lancamento']}
 • **Valor:** R$ {dados['valor']:.2f}
 • **Categoria:** {dados['categoria']}
-• **Descrição:** {dados['descricao']}
+• **Descrição:** {escape_markdown(dados['descricao'])}
 • **Data:** {dados['data']}
 
 Confirma o envio desta transação?
@@ -258,9 +319,134 @@ Confirma o envio desta transação?
         reply_markup=reply_markup,
         parse_mode='Markdown'
     )
+
+def tipo_despesa_preferido(user_id: int) -> str:
+    """Tipo de despesa mais usado pelo usuário (padrão: Despesa Débito)"""
+    for linha in modelo_preferencias.teclado_tipos(user_id):
+        for tipo in linha:
+            if tipo.startswith('Despesa'):
+                return tipo
+    return 'Despesa Débito'
+
+async def receber_recibo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Lê a foto ou o PDF de um recibo e preenche o lançamento"""
+    user_id = update.effective_user.id
+    message = update.message
+    
+    if pool_ocr.encerrando:
+        await message.reply_text(
+            "⏳ O bot está reiniciando. Envie o recibo novamente em instantes."
+        )
+        return ConversationHandler.END
+    
+    await message.reply_text("🔎 Lendo o recibo...")
+    
+    try:
+        # get_file falha (BadRequest) para arquivos acima do limite da Bot API
+        if message.photo:
+            arquivo = await message.photo[-1].get_file()
+            pdf = False
+        else:
+            arquivo = await message.document.get_file()
+            pdf = message.document.mime_type == 'application/pdf'
+        
+        conteudo = bytes(await arquivo.download_as_bytearray())
+        recibo = await pool_ocr.processar(conteudo, pdf)
+    except FilaOCRCheia:
+        await message.reply_text(
+            "⏳ Muitos recibos sendo lidos agora. Tente novamente em instantes."
+        )
+        return ConversationHandler.END
+    except OCRInterrompido:
+        await message.reply_text(
+            "⏳ O bot está reiniciando. Envie o recibo novamente em instantes."
+        )
+        return ConversationHandler.END
+    except Exception as e:
+        logger.error(f"Erro ao ler recibo: {e}")
+        await message.reply_text(
+            "❌ Não consegui ler o recibo.\n\n"
+            "Digite /novo para registrar a transação manualmente."
+        )
+        return ConversationHandler.END
+    
+    if not recibo['valor']:
+        await message.reply_text(
+            "❌ Não encontrei o valor total no recibo.\n\n"
+            "Digite /novo para registrar a transação manualmente."
+        )
+        return ConversationHandler.END
+    
+    estabelecimento = recibo['estabelecimento'] or 'Recibo'
+    tipo = tipo_despesa_preferido(user_id)
+    user_data_storage[user_id] = {
+        'tipo_lancamento': tipo,
+        'valor': recibo['valor'],
+        'descricao': estabelecimento,
+        'data': recibo['data'] or datetime.now().strftime('%d/%m/%Y'),
+    }
+    
+    # Histórico do usuário primeiro, depois a tabela de estabelecimentos
+    categoria = modelo_preferencias.sugerir_categoria(user_id, estabelecimento) or recibo['categoria']
+    
+    if categoria is None:
+        keyboard = modelo_preferencias.teclado_categorias(user_id, tipo)
+        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+        
+        await message.reply_text(
+            f"🧾 Recibo lido: {escape_markdown(estabelecimento)} - *R$ {recibo['valor']:.2f}*\n\n"
+            "Selecione a categoria:",
+            reply_markup=reply_markup,
+            parse_mode='Markdown'
+        )
+        return CATEGORIA_RECIBO
+    
+    user_data_storage[user_id]['categoria'] = categoria
+    await enviar_resumo(update, user_data_storage[user_id])
     
     return ConversationHandler.END
 
+async def receber_categoria_recibo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Recebe a categoria de um recibo cujo estabelecimento não foi reconhecido"""
+    user_id = update.effective_user.id
+    categoria = update.message.text
+    
+    if categoria not in CATEGORIAS:
+        await update.message.reply_text(
+            "❌ Categoria inválida. Por favor, selecione uma das opções do teclado."
+        )
+        return CATEGORIA_RECIBO
+    
+    user_data_storage[user_id]['categoria'] = categoria
+    await enviar_resumo(update, user_data_storage[user_id])
+    
+    return ConversationHandler.END
+
+async def aplicar_sugestao_categoria(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Troca a categoria pela sugerida a partir da descrição"""
+    query = update.callback_query
+    await query.answer()
+    
+    user_id = query.from_user.id
+    categoria = CATEGORIAS[int(query.data.split(':', 1)[1])]
+    
+    dados = user_data_storage.get(user_id)
+    
+    # Só vale para o rascunho que gerou a sugestão, antes da data ser enviada
+    if not dados or dados.get('sugestao_mensagem') != query.message.message_id or 'data' in dados:
+        await query.edit_message_reply_markup(reply_markup=None)
+        return
+    
+    dados['categoria'] = categoria
+    del dados['sugestao_mensagem']
+    
+    await query.edit_message_text(
+        f"✅ Categoria alterada para: *{categoria}*\n\n"
+        "**5/5** - Digite a data do lançamento ou envie 'hoje' para usar a data atual:\n"
+        "Formato: DD/MM/AAAA ou 'hoje'",
+        parse_mode='Markdown'
+    )
+
 async def confirmar_envio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Confirma e processa o envio"""
     query = update.callback_query
@@ -274,9 +460,32 @@ async def confirmar_envio(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             
             # Aqui seria feita a integração com o Google Forms
             # Por enquanto, vamos simular o envio
-            sucesso = await enviar_para_google_forms(dados)
+            try:
+                sucesso = await controle_envios.executar(enviar_para_google_forms(dados))
+            except EnvioInterrompido:
+                # A requisição pode ter chegado: não oferecer reenvio automático
+                del user_data_storage[user_id]
+                await query.edit_message_text(
+                    "⚠️ *Envio interrompido*\n\n"
+                    "O bot reiniciou durante o envio e não foi possível confirmar "
+                    "se a transação foi registrada. Verifique a planilha antes de "
+                    "registrá-la novamente com /novo.",
+                    parse_mode='Markdown'
+                )
+                return
+            
+            if sucesso is None:
+                # Bot desligando antes do envio: o rascunho é mantido no snapshot
+                await query.message.reply_text(
+                    "⏳ O bot está reiniciando. Seus dados foram mantidos.\n\n"
+                    "Toque em ✅ Confirmar novamente em instantes."
+                )
+                return
             
             if sucesso:
+                # Aprender com o lançamento para ordenar os próximos teclados
+                modelo_preferencias.registrar(user_id, dados)
+                
                 await query.edit_message_text(
                     "✅ *Transação registrada com sucesso!*\n\n"
                     "Seus dados foram enviados para o sistema financeiro.\n\n"
@@ -336,37 +545,122 @@ async def cancelar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     
     return ConversationHandler.END
 
+async def salvar_preferencias_periodicamente(parar: asyncio.Event) -> None:
+    """
+    Persiste as preferências em lotes, gravando o arquivo fora do loop
+
+    Quando `parar` é sinalizado, faz uma última gravação e termina; aguardar
+    a tarefa garante que nenhuma gravação fica pendente.
+    """
+    while not parar.is_set():
+        try:
+            await asyncio.wait_for(parar.wait(), PREFERENCIAS_INTERVALO)
+        except asyncio.TimeoutError:
+            pass
+        conteudo = modelo_preferencias.serializar()
+        if conteudo is not None:
+            await asyncio.to_thread(modelo_preferencias.gravar, conteudo)
+
+async def executar_bot(application: Application) -> None:
+    """Executa o bot até receber SIGINT/SIGTERM e então desliga sem perder dados"""
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sinal in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sinal, parar.set)
+        except NotImplementedError:
+            # Windows: sem suporte a add_signal_handler
+            signal.signal(sinal, lambda *_: loop.call_soon_threadsafe(parar.set))
+    
+    # initialize() carrega o snapshot; shutdown() grava o novo
+    async with application:
+        total = restaurar_rascunhos(application.bot_data, user_data_storage)
+        logger.info(f"Rascunhos restaurados: {total}")
+        
+        await application.start()
+        await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        parar_salvamento = asyncio.Event()
+        salvamento = asyncio.create_task(salvar_preferencias_periodicamente(parar_salvamento))
+        logger.info("Bot iniciado!")
+        
+        await parar.wait()
+        
+        # 1. Parar de receber atualizações
+        logger.info("Encerrando bot...")
+        await application.updater.stop()
+        
+        # 2. Drenar envios e recibos em andamento dentro do mesmo prazo; a
+        #    partir daqui novos envios e recibos são recusados
+        _, recibos_abortados = await asyncio.gather(
+            controle_envios.drenar(PRAZO_ENCERRAMENTO),
+            pool_ocr.drenar(PRAZO_ENCERRAMENTO),
+        )
+        if recibos_abortados:
+            logger.warning(f"{recibos_abortados} recibo(s) abortado(s) pelo prazo de encerramento")
+        
+        # 3. Processar o que já estava na fila (envios e recibos são recusados)
+        await application.stop()
+        pool_ocr.encerrar()
+        
+        # 4. Gravar as preferências pendentes
+        parar_salvamento.set()
+        await salvamento
+    
+    logger.info("Bot encerrado. Sessões salvas.")
+
 def main() -> None:
     """Função principal"""
     if not TOKEN:
         logger.error("Token do Telegram não encontrado!")
         return
     
-    # Criar aplicação
-    application = Application.builder().token(TOKEN).build()
+    if PRAZO_ENCERRAMENTO <= 2 * TIMEOUT_ENVIO:
+        logger.warning(
+            f"PRAZO_ENCERRAMENTO ({PRAZO_ENCERRAMENTO}s) deve ser maior que {2 * TIMEOUT_ENVIO}s; "
+            "envios lentos podem ficar com resultado desconhecido no desligamento."
+        )
+    
+    # Carregar preferências aprendidas
+    modelo_preferencias.carregar()
+    
+    # Criar aplicação (rascunhos e estados de conversa sobrevivem a reinícios)
+    application = Application.builder().token(TOKEN).persistence(criar_persistencia(SESSOES_FILE)).build()
     
     # Configurar handlers de conversa
     conv_handler = ConversationHandler(
-        entry_points=[CommandHandler('novo', novo_lancamento)],
+        entry_points=[
+            CommandHandler('novo', novo_lancamento),
+            # Não bloqueante: o OCR de um recibo não trava as atualizações dos
+            # demais usuários; a conversa deste usuário espera o resultado
+            MessageHandler(
+                filters.PHOTO | filters.Document.PDF | filters.Document.IMAGE,
+                receber_recibo,
+                block=False,
+            ),
+        ],
         states={
             TIPO_LANCAMENTO: [MessageHandler(filters.TEXT & ~filters.COMMAND, receber_tipo_lancamento)],
             VALOR: [MessageHandler(filters.TEXT & ~filters.COMMAND, receber_valor)],
             CATEGORIA: [MessageHandler(filters.TEXT & ~filters.COMMAND, receber_categoria)],
             DESCRICAO: [MessageHandler(filters.TEXT & ~filters.COMMAND, receber_descricao)],
             DATA: [MessageHandler(filters.TEXT & ~filters.COMMAND, receber_data)],
+            CATEGORIA_RECIBO: [MessageHandler(filters.TEXT & ~filters.COMMAND, receber_categoria_recibo)],
         },
         fallbacks=[CommandHandler('cancelar', cancelar)],
+        name='novo_lancamento',
+        persistent=True,
     )
     
     # Adicionar handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("ajuda", help_command))
     application.add_handler(conv_handler)
+    application.add_handler(CallbackQueryHandler(aplicar_sugestao_categoria, pattern=r'^sugestao_categoria:'))
     application.add_handler(CallbackQueryHandler(confirmar_envio))
     
     # Iniciar bot
-    logger.info("Bot iniciado!")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    asyncio.run(executar_bot(application))
+
 
 if __name__ == '__main__':
     main()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import asyncio
 import requests
 import logging
 from typing import Dict, Any, Optional
@@ -9,6 +10,10 @@ from manual_form_config import get_field_mapping, FORM_SUBMIT_URL
 
 logger = logging.getLogger(__name__)
 
+# Timeout (s) de conexão e de leitura do envio; no pior caso um envio leva
+# cerca do dobro disso
+TIMEOUT_ENVIO = 10
+
 class GoogleFormsIntegration:
     """Classe para integração com Google Forms"""
     
@@ -62,12 +67,13 @@ class GoogleFormsIntegration:
                 'Referer': self.form_url
             }
             
-            # Fazer requisição POST
-            response = requests.post(
+            # Fazer requisição POST em outra thread, sem bloquear o bot
+            response = await asyncio.to_thread(
+                requests.post,
                 self.submit_url,
                 data=form_data,
                 headers=headers,
-                timeout=10,
+                timeout=TIMEOUT_ENVIO,
                 allow_redirects=True
             )
             
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Modelo de preferências por usuário
+Aprende, a cada lançamento confirmado, quais tipos e categorias cada usuário
+mais usa e quais palavras da descrição costumam indicar cada categoria
+"""
+
+import os
+import re
+import json
+import logging
+import tempfile
+import threading
+import unicodedata
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fator de decaimento aplicado a cada novo lançamento do usuário.
+# Combina frequência e recência: um uso antigo vale menos que um recente
+# (meia-vida de ~23 lançamentos).
+DECAIMENTO = 0.97
+
+# Associações palavra -> categoria com score abaixo disso são descartadas
+# ao salvar (~100 lançamentos sem reaparecer), mantendo o arquivo compacto
+SCORE_MINIMO = 0.05
+
+# Palavras menores que isso não entram na associação descrição -> categoria
+TAMANHO_MINIMO_PALAVRA = 3
+
+Teclado = Tuple[Tuple[str, ...], ...]
+
+
+def montar_linhas(opcoes: Sequence[str], colunas: int) -> Teclado:
+    """Distribui as opções em linhas com o número de colunas informado"""
+    return tuple(
+        tuple(opcoes[i:i + colunas]) for i in range(0, len(opcoes), colunas)
+    )
+
+
+def extrair_palavras(texto: str) -> List[str]:
+    """
+    Normaliza a descrição em palavras-chave (minúsculas, sem acentos)
+
+    Args:
+        texto: Descrição digitada pelo usuário
+
+    Returns:
+        list: Palavras distintas relevantes para a associação com categorias
+    """
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    palavras = re.findall(r'[a-z]+', texto)
+    return sorted({p for p in palavras if len(p) >= TAMANHO_MINIMO_PALAVRA})
+
+
+class ModeloPreferencias:
+    """Modelo incremental de frequência/recência por usuário"""
+
+    def __init__(self, tipos: Sequence[str], categorias: Sequence[str],
+                 caminho: str, colunas_tipos: int = 2, colunas_categorias: int = 3):
+        """
+        Inicializa o modelo
+
+        Args:
+            tipos: Tipos de lançamento, na ordem padrão
+            categorias: Categorias, na ordem padrão
+            caminho: Arquivo JSON onde o modelo é persistido
+            colunas_tipos: Botões por linha no teclado de tipos
+            colunas_categorias: Botões por linha no teclado de categorias
+        """
+        self.tipos = list(tipos)
+        self.categorias = list(categorias)
+        self.caminho = caminho
+        self.colunas_tipos = colunas_tipos
+        self.colunas_categorias = colunas_categorias
+
+        # Índices para guardar números em vez de nomes; o arquivo leva junto
+        # as listas, para remapear se TIPOS_LANCAMENTO/CATEGORIAS mudarem
+        self._indice_tipo = {t: i for i, t in enumerate(self.tipos)}
+        self._indice_categoria = {c: i for i, c in enumerate(self.categorias)}
+
+        # Teclados padrão, usados por quem ainda não tem histórico
+        self.teclado_tipos_padrao = montar_linhas(self.tipos, colunas_tipos)
+        self.teclado_categorias_padrao = montar_linhas(self.categorias, colunas_categorias)
+
+        # user_id -> {'n': lançamentos, 't': {tipo: [score, n]},
+        #             'c': {categoria: [score, n]}, 'p': {tipo: {categoria: [score, n]}},
+        #             'd': {palavra: {categoria: [score, n]}}}
+        self._usuarios: Dict[int, Dict[str, Any]] = {}
+
+        # Indica se há lançamentos ainda não persistidos
+        self.alterado = False
+
+        # gravar() pode rodar em outra thread; uma gravação por vez
+        self._trava_gravacao = threading.Lock()
+
+        # user_id -> {chave: teclado}; invalidado a cada novo lançamento
+        self._cache: Dict[int, Dict[Any, Teclado]] = {}
+
+    @staticmethod
+    def _atualizar_score(tabela: Dict[int, List[float]], chave: int, n: int) -> None:
+        """Aplica o decaimento pendente e soma um uso, em O(1)"""
+        entrada = tabela.get(chave)
+        if entrada is None:
+            tabela[chave] = [1.0, n]
+        else:
+            entrada[0] = round(entrada[0] * DECAIMENTO ** (n - entrada[1]) + 1.0, 4)
+            entrada[1] = n
+
+    @staticmethod
+    def _score(tabela: Dict[int, List[float]], chave: int, n: int) -> float:
+        """Score da chave trazido para o instante n do usuário"""
+        entrada = tabela.get(chave)
+        if entrada is None:
+            return 0.0
+        return entrada[0] * DECAIMENTO ** (n - entrada[1])
+
+    def registrar(self, user_id: int, dados: Dict[str, Any]) -> None:
+        """
+        Registra um lançamento confirmado
+
+        Args:
+            user_id: ID do usuário no Telegram
+            dados: Dados do lançamento (tipo_lancamento, categoria, descricao)
+        """
+        tipo = self._indice_tipo.get(dados.get('tipo_lancamento'))
+        categoria = self._indice_categoria.get(dados.get('categoria'))
+        if tipo is None or categoria is None:
+            return
+
+        modelo = self._usuarios.setdefault(user_id, {'n': 0, 't': {}, 'c': {}, 'p': {}, 'd': {}})
+        modelo['n'] += 1
+        n = modelo['n']
+
+        self._atualizar_score(modelo['t'], tipo, n)
+        self._atualizar_score(modelo['c'], categoria, n)
+        self._atualizar_score(modelo['p'].setdefault(tipo, {}), categoria, n)
+
+        for palavra in extrair_palavras(dados.get('descricao') or ''):
+            self._atualizar_score(modelo['d'].setdefault(palavra, {}), categoria, n)
+
+        self._cache.pop(user_id, None)
+        self.alterado = True
+
+    def teclado_tipos(self, user_id: int) -> Teclado:
+        """Teclado de tipos de lançamento ordenado para o usuário"""
+        modelo = self._usuarios.get(user_id)
+        if modelo is None:
+            return self.teclado_tipos_padrao
+
+        cache = self._cache.setdefault(user_id, {})
+        teclado = cache.get('tipos')
+        if teclado is None:
+            n = modelo['n']
+            ordem = sorted(
+                range(len(self.tipos)),
+                key=lambda i: (-self._score(modelo['t'], i, n), i)
+            )
+            teclado = montar_linhas([self.tipos[i] for i in ordem], self.colunas_tipos)
+            cache['tipos'] = teclado
+        return teclado
+
+    def teclado_categorias(self, user_id: int, tipo: Optional[str] = None) -> Teclado:
+        """
+        Teclado de categorias ordenado para o usuário
+
+        Categorias já usadas com o tipo escolhido vêm primeiro, depois as
+        mais usadas no geral e, por fim, as demais na ordem padrão.
+        """
+        modelo = self._usuarios.get(user_id)
+        if modelo is None:
+            return self.teclado_categorias_padrao
+
+        indice_tipo = self._indice_tipo.get(tipo)
+        cache = self._cache.setdefault(user_id, {})
+        teclado = cache.get(('categorias', indice_tipo))
+        if teclado is None:
+            n = modelo['n']
+            pares = modelo['p'].get(indice_tipo, {})
+            ordem = sorted(
+                range(len(self.categorias)),
+                key=lambda i: (-self._score(pares, i, n), -self._score(modelo['c'], i, n), i)
+            )
+            teclado = montar_linhas([self.categorias[i] for i in ordem], self.colunas_categorias)
+            cache[('categorias', indice_tipo)] = teclado
+        return teclado
+
+    def sugerir_categoria(self, user_id: int, descricao: str) -> Optional[str]:
+        """
+        Sugere a categoria mais provável para uma descrição
+
+        Cada palavra vota nas categorias em que já apareceu, com peso
+        proporcional à frequência dentro daquela palavra.
+
+        Returns:
+            str: Categoria sugerida, ou None se não houver histórico suficiente
+        """
+        modelo = self._usuarios.get(user_id)
+        if modelo is None:
+            return None
+
+        n = modelo['n']
+        votos: Dict[int, float] = {}
+        for palavra in extrair_palavras(descricao):
+            scores = modelo['d'].get(palavra)
+            if not scores:
+                continue
+            atuais = {categoria: self._score(scores, categoria, n) for categoria in scores}
+            total = sum(atuais.values())
+            for categoria, score in atuais.items():
+                votos[categoria] = votos.get(categoria, 0.0) + score / total
+
+        if not votos:
+            return None
+        melhor = max(votos, key=lambda c: (votos[c], -c))
+        return self.categorias[melhor]
+
+    def carregar(self) -> None:
+        """Carrega o modelo do arquivo, se existir"""
+        if not os.path.exists(self.caminho):
+            return
+
+        try:
+            with open(self.caminho, 'r', encoding='utf-8') as f:
+                bruto = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Erro ao carregar preferências: {e}")
+            return
+
+        try:
+            # Índice salvo -> índice atual, pelo nome; itens removidos da
+            # lista são descartados
+            mapa_tipos = {
+                i: self._indice_tipo[nome] for i, nome in enumerate(bruto['tipos'])
+                if nome in self._indice_tipo
+            }
+            mapa_categorias = {
+                i: self._indice_categoria[nome] for i, nome in enumerate(bruto['categorias'])
+                if nome in self._indice_categoria
+            }
+
+            # JSON só tem chaves string: converter de volta para inteiros
+            def remapear(tabela, mapa):
+                return {mapa[int(k)]: v for k, v in tabela.items() if int(k) in mapa}
+
+            usuarios = {}
+            for user_id, modelo in bruto['usuarios'].items():
+                palavras = {
+                    palavra: remapear(scores, mapa_categorias)
+                    for palavra, scores in modelo['d'].items()
+                }
+                usuarios[int(user_id)] = {
+                    'n': modelo['n'],
+                    't': remapear(modelo['t'], mapa_tipos),
+                    'c': remapear(modelo['c'], mapa_categorias),
+                    'p': {
+                        tipo: remapear(pares, mapa_categorias)
+                        for tipo, pares in remapear(modelo['p'], mapa_tipos).items()
+                    },
+                    'd': {palavra: scores for palavra, scores in palavras.items() if scores},
+                }
+        except (KeyError, AttributeError, TypeError, ValueError) as e:
+            # Arquivo com estrutura inesperada: começar com o modelo vazio
+            logger.error(f"Preferências com formato inválido, ignorando arquivo: {e!r}")
+            return
+
+        self._usuarios = usuarios
+        self._cache.clear()
+        logger.info(f"Preferências carregadas para {len(self._usuarios)} usuário(s)")
+
+    def _podar(self) -> None:
+        """Descarta associações de palavras que já perderam relevância"""
+        for modelo in self._usuarios.values():
+            n = modelo['n']
+            for palavra in list(modelo['d']):
+                scores = modelo['d'][palavra]
+                for categoria in [c for c in scores if self._score(scores, c, n) < SCORE_MINIMO]:
+                    del scores[categoria]
+                if not scores:
+                    del modelo['d'][palavra]
+
+    def serializar(self) -> Optional[str]:
+        """
+        Gera o JSON compacto do modelo, se houver lançamentos não persistidos
+
+        Deve ser chamado no loop do bot; a gravação em disco (gravar) pode
+        então ser feita em outra thread.
+
+        Returns:
+            str: Conteúdo do arquivo, ou None se nada mudou
+        """
+        if not self.alterado:
+            return None
+        self._podar()
+        self.alterado = False
+        return json.dumps(
+            {'tipos': self.tipos, 'categorias': self.categorias, 'usuarios': self._usuarios},
+            ensure_ascii=False, separators=(',', ':')
+        )
+
+    def gravar(self, conteudo: str) -> None:
+        """Grava o conteúdo serializado (escrita atômica, uma por vez)"""
+        with self._trava_gravacao:
+            temporario = None
+            try:
+                descritor, temporario = tempfile.mkstemp(
+                    dir=os.path.dirname(os.path.abspath(self.caminho)), suffix='.tmp'
+                )
+                with os.fdopen(descritor, 'w', encoding='utf-8') as f:
+                    f.write(conteudo)
+                os.replace(temporario, self.caminho)
+            except OSError as e:
+                logger.error(f"Erro ao salvar preferências: {e}")
+                if temporario and os.path.exists(temporario):
+                    os.remove(temporario)
+
+    def salvar(self) -> None:
+        """Persiste o modelo, se houver alterações"""
+        conteudo = self.serializar()
+        if conteudo is not None:
+            self.gravar(conteudo)
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Leitura de recibos por OCR local
+Extrai total, estabelecimento e data de fotos ou PDFs de recibos usando o
+Tesseract em um pool de processos, sem bloquear os handlers do bot
+"""
+
+import io
+import re
+import asyncio
+import multiprocessing
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Set
+
+# Palavras-chave de estabelecimentos -> categoria do formulário.
+# As chaves já estão normalizadas (minúsculas, sem acentos).
+ESTABELECIMENTOS_CATEGORIAS = {
+    'supermercado': 'Supermercado',
+    'mercado': 'Supermercado',
+    'carrefour': 'Supermercado',
+    'pao de acucar': 'Supermercado',
+    'assai': 'Supermercado',
+    'atacadao': 'Supermercado',
+    'hortifruti': 'Supermercado',
+    'farmacia': 'Farmácia',
+    'drogaria': 'Farmácia',
+    'drogasil': 'Farmácia',
+    'droga raia': 'Farmácia',
+    'pague menos': 'Farmácia',
+    'posto': 'Posto de Gasolina',
+    'combustiveis': 'Posto de Gasolina',
+    'ipiranga': 'Posto de Gasolina',
+    'shell': 'Posto de Gasolina',
+    'petrobras': 'Posto de Gasolina',
+    'restaurante': 'Restaurante',
+    'lanchonete': 'Restaurante',
+    'padaria': 'Restaurante',
+    'pizzaria': 'Restaurante',
+    'churrascaria': 'Restaurante',
+    'mcdonalds': 'Restaurante',
+    'burger king': 'Restaurante',
+    'ifood': 'Restaurante',
+    'auto pecas': 'Carro',
+    'autopecas': 'Carro',
+    'oficina': 'Carro',
+    'odonto': 'Dentista',
+    'odontologia': 'Dentista',
+    'mercado livre': 'Mercado Livre',
+    'pet shop': 'Animais',
+    'petz': 'Animais',
+    'cobasi': 'Animais',
+    'veterinaria': 'Animais',
+    'uber': 'Transporte',
+    'metro': 'Transporte',
+    'estacionamento': 'Transporte',
+}
+
+# Páginas de um PDF lidas por recibo (um recibo raramente passa disso e
+# cada página a 300 dpi ocupa um processo por vários segundos)
+PAGINAS_PDF_MAXIMO = 2
+
+# Chaves genéricas só decidem a categoria quando nenhuma outra aparece no
+# nome (ex.: 'METRO SUPERMERCADOS' é supermercado, não transporte)
+CHAVES_GENERICAS = {'mercado', 'metro', 'posto', 'oficina'}
+
+# Terminações de plural aceitas no fim de cada palavra da chave
+# ('supermercados', 'drogarias', 'postos')
+SUFIXOS_PLURAL = ('', 's', 'es')
+
+# Linhas do topo do recibo que não são o nome do estabelecimento
+PREFIXOS_IGNORADOS = ('cnpj', 'cpf', 'ie ', 'im ', 'cupom', 'nota', 'documento', 'danfe', 'nfc')
+
+_RE_VALOR = re.compile(r'\d{1,3}(?:\.\d{3})+,\d{2}|\d+[.,]\d{2}(?!\d)')
+_RE_DATA = re.compile(r'\b(\d{2})[/.-](\d{2})[/.-](\d{4}|\d{2})\b')
+# Rótulos do total por prioridade: na NFC-e 'Valor total' vem antes do
+# desconto e 'Valor a pagar' depois dele; 'Valor pago' é o valor entregue
+# (pode incluir troco), então só é usado na falta dos outros
+_RE_TOTAIS = [
+    re.compile(r'\b(valor a pagar|total a pagar)\b'),
+    re.compile(r'\b(valor total|total)\b'),
+    re.compile(r'\bvalor pago\b'),
+]
+# Linhas com 'total' que não são o valor da compra (tributos, valor
+# recebido, quantidade de itens, pagamento, troco)
+_RE_TOTAL_QUALIFICADO = re.compile(r'\b(tributos?|impostos?|aprox|recebido|itens|pago|troco)\b')
+
+
+class FilaOCRCheia(Exception):
+    """Exceção lançada quando a fila de reconhecimento está cheia"""
+
+
+class OCRInterrompido(Exception):
+    """Recibo recusado ou abortado porque o bot está sendo desligado"""
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sem acentos e apenas letras/números separados por espaço"""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'[a-z0-9]+', texto))
+
+
+def converter_valor(texto: str) -> float:
+    """Converte '1.234,56', '12,90' ou '12.90' em float"""
+    if ',' in texto:
+        texto = texto.replace('.', '').replace(',', '.')
+    return float(texto)
+
+
+@lru_cache(maxsize=1024)
+def categoria_estabelecimento(estabelecimento: str) -> Optional[str]:
+    """
+    Busca a categoria de um estabelecimento na tabela de palavras-chave
+
+    Cada palavra da chave casa com a mesma palavra do nome ou com o seu
+    plural (SUFIXOS_PLURAL). Chaves específicas vencem as genéricas e, entre
+    elas, a mais longa (ex.: 'mercado livre' antes de 'mercado').
+
+    Args:
+        estabelecimento: Nome do estabelecimento como lido no recibo
+
+    Returns:
+        str: Categoria correspondente, ou None se não houver correspondência
+    """
+    palavras = normalizar(estabelecimento).split()
+
+    def casa(chave: str) -> bool:
+        partes = chave.split()
+        return any(
+            all(
+                palavra in {parte + sufixo for sufixo in SUFIXOS_PLURAL}
+                for palavra, parte in zip(palavras[i:], partes)
+            )
+            for i in range(len(palavras) - len(partes) + 1)
+        )
+
+    encontradas = [chave for chave in ESTABELECIMENTOS_CATEGORIAS if casa(chave)]
+    if not encontradas:
+        return None
+    melhor = max(encontradas, key=lambda chave: (chave not in CHAVES_GENERICAS, len(chave)))
+    return ESTABELECIMENTOS_CATEGORIAS[melhor]
+
+
+def extrair_total(linhas: List[str]) -> Optional[float]:
+    """
+    Valor da primeira linha de total de maior prioridade, ignorando linhas
+    de total qualificadas (tributos, recebido...); na falta dela, o maior
+    valor do recibo
+    """
+    normalizadas = [normalizar(linha) for linha in linhas]
+    for rotulo in _RE_TOTAIS:
+        for linha, normalizada in zip(linhas, normalizadas):
+            if not rotulo.search(normalizada):
+                continue
+            # 'valor pago' já é o último recurso; nos demais, pular qualificadas
+            if rotulo is not _RE_TOTAIS[-1] and _RE_TOTAL_QUALIFICADO.search(normalizada):
+                continue
+            valores = _RE_VALOR.findall(linha)
+            if valores:
+                return converter_valor(valores[-1])
+
+    valores = [converter_valor(v) for linha in linhas for v in _RE_VALOR.findall(linha)]
+    return max(valores) if valores else None
+
+
+def extrair_data(texto: str) -> Optional[str]:
+    """Primeira data válida do recibo, no formato DD/MM/AAAA"""
+    for dia, mes, ano in _RE_DATA.findall(texto):
+        if len(ano) == 2:
+            ano = f"20{ano}"
+        try:
+            return datetime(int(ano), int(mes), int(dia)).strftime('%d/%m/%Y')
+        except ValueError:
+            continue
+    return None
+
+
+def extrair_estabelecimento(linhas: List[str]) -> Optional[str]:
+    """Primeira linha do topo do recibo que parece um nome"""
+    for linha in linhas[:8]:
+        linha = ' '.join(linha.split())
+        letras = sum(c.isalpha() for c in linha)
+        if letras < 3 or letras < len(linha.replace(' ', '')) / 2:
+            continue
+        if normalizar(linha).startswith(PREFIXOS_IGNORADOS):
+            continue
+        return linha
+    return None
+
+
+def interpretar_recibo(texto: str) -> Dict[str, Any]:
+    """
+    Extrai os campos do lançamento a partir do texto do recibo
+
+    Args:
+        texto: Texto reconhecido pelo OCR
+
+    Returns:
+        dict: valor, estabelecimento, data e categoria (None quando não encontrados)
+    """
+    linhas = [linha.strip() for linha in texto.splitlines() if linha.strip()]
+    estabelecimento = extrair_estabelecimento(linhas)
+
+    return {
+        'valor': extrair_total(linhas),
+        'estabelecimento': estabelecimento,
+        'data': extrair_data(texto),
+        'categoria': categoria_estabelecimento(estabelecimento) if estabelecimento else None,
+    }
+
+
+def reconhecer_texto(conteudo: bytes, pdf: bool = False, idioma: str = 'por') -> str:
+    """
+    Executa o OCR (Tesseract) sobre a imagem ou PDF do recibo
+
+    Args:
+        conteudo: Bytes do arquivo enviado
+        pdf: True se o arquivo é um PDF (só as primeiras PAGINAS_PDF_MAXIMO páginas)
+        idioma: Idioma do Tesseract
+
+    Returns:
+        str: Texto reconhecido
+    """
+    import pytesseract
+    from PIL import Image
+
+    if pdf:
+        from pdf2image import convert_from_bytes
+        paginas = convert_from_bytes(conteudo, dpi=300, first_page=1, last_page=PAGINAS_PDF_MAXIMO)
+    else:
+        paginas = [Image.open(io.BytesIO(conteudo))]
+
+    return '\n'.join(
+        pytesseract.image_to_string(pagina.convert('L'), lang=idioma)
+        for pagina in paginas
+    )
+
+
+def processar_recibo(conteudo: bytes, pdf: bool = False, idioma: str = 'por') -> Dict[str, Any]:
+    """Reconhece e interpreta um recibo (executado nos processos do pool)"""
+    return interpretar_recibo(reconhecer_texto(conteudo, pdf, idioma))
+
+
+class PoolOCR:
+    """Pool de processos para o reconhecimento de recibos"""
+
+    def __init__(self, tamanho: int, fila_maxima: int, idioma: str = 'por'):
+        """
+        Inicializa o pool (os processos só são criados no primeiro uso)
+
+        Args:
+            tamanho: Número de processos de OCR
+            fila_maxima: Máximo de recibos em processamento ou aguardando
+            idioma: Idioma do Tesseract
+        """
+        self.tamanho = tamanho
+        self.fila_maxima = fila_maxima
+        self.idioma = idioma
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pendentes = 0
+        self.encerrando = False
+        self._futuros: Set[asyncio.Future] = set()
+        self._abortados: Set[asyncio.Future] = set()
+
+    @property
+    def pendentes(self) -> int:
+        """Recibos em processamento ou aguardando um processo livre"""
+        return self._pendentes
+
+    def _obter_executor(self) -> ProcessPoolExecutor:
+        """Cria o pool no primeiro uso"""
+        if self._executor is None:
+            # 'spawn' evita herdar por fork as threads e locks do processo do bot
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.tamanho,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return self._executor
+
+    async def processar(self, conteudo: bytes, pdf: bool = False) -> Dict[str, Any]:
+        """
+        Processa um recibo em um dos processos do pool
+
+        Args:
+            conteudo: Bytes da foto ou do PDF
+            pdf: True se o arquivo é um PDF
+
+        Returns:
+            dict: Campos extraídos (ver interpretar_recibo)
+
+        Raises:
+            FilaOCRCheia: Se já houver fila_maxima recibos pendentes
+            OCRInterrompido: Se o bot está sendo desligado
+        """
+        if self.encerrando:
+            raise OCRInterrompido()
+        if self._pendentes >= self.fila_maxima:
+            raise FilaOCRCheia(f"{self._pendentes} recibo(s) já na fila")
+
+        self._pendentes += 1
+        loop = asyncio.get_running_loop()
+        futuro = loop.run_in_executor(
+            self._obter_executor(), processar_recibo, conteudo, pdf, self.idioma
+        )
+        self._futuros.add(futuro)
+        try:
+            return await futuro
+        except asyncio.CancelledError:
+            if futuro in self._abortados:
+                raise OCRInterrompido() from None
+            raise
+        finally:
+            self._pendentes -= 1
+            self._futuros.discard(futuro)
+            self._abortados.discard(futuro)
+
+    async def drenar(self, prazo: float) -> int:
+        """
+        Recusa novos recibos e aguarda os pendentes até o prazo
+
+        Recibos que não terminarem dentro do prazo são abortados
+        (OCRInterrompido para quem os aguardava).
+
+        Args:
+            prazo: Tempo máximo de espera, em segundos
+
+        Returns:
+            int: Quantidade de recibos abortados
+        """
+        self.encerrando = True
+        if not self._futuros:
+            return 0
+
+        _, pendentes = await asyncio.wait(set(self._futuros), timeout=prazo)
+        for futuro in pendentes:
+            self._abortados.add(futuro)
+            futuro.cancel()
+        return len(pendentes)
+
+    def encerrar(self) -> None:
+        """Encerra os processos, descartando recibos que ainda não começaram"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -39,7 +39,7 @@ else:
 
 echo ""
 echo "🚀 Iniciando bot..."
-echo "Pressione Ctrl+C para parar"
+echo "Pressione Ctrl+C para parar (conversas em andamento são salvas)"
 echo ""
 
 # Executar o bot
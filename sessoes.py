@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Sessões e encerramento controlado do bot
+Acompanha os envios em andamento para drená-los no desligamento e guarda
+rascunhos e estados de conversa em um snapshot restaurado na inicialização
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Optional, Set
+
+from telegram.ext import PersistenceInput, PicklePersistence
+
+logger = logging.getLogger(__name__)
+
+# Chave em bot_data onde os rascunhos (user_data_storage) são guardados
+CHAVE_RASCUNHOS = 'rascunhos'
+
+
+class EnvioInterrompido(Exception):
+    """Envio abortado pelo prazo de encerramento; o resultado é desconhecido"""
+
+
+class ControleEnvios:
+    """Controla os envios em andamento para permitir um desligamento sem perdas"""
+
+    def __init__(self):
+        """Inicializa o controle sem envios pendentes"""
+        self.encerrando = False
+        self._tarefas: Set[asyncio.Task] = set()
+        self._abortadas: Set[asyncio.Task] = set()
+
+    @property
+    def pendentes(self) -> int:
+        """Quantidade de envios em andamento"""
+        return len(self._tarefas)
+
+    async def executar(self, envio: Awaitable[bool]) -> Optional[bool]:
+        """
+        Executa um envio acompanhando-o até o fim
+
+        Args:
+            envio: Corrotina do envio (ex.: enviar_para_google_forms(dados))
+
+        Returns:
+            bool: Resultado do envio, ou None se ele foi recusado por já
+            estar em desligamento (nada foi enviado; o rascunho deve ser mantido)
+
+        Raises:
+            EnvioInterrompido: Se o envio foi abortado pelo prazo de
+            encerramento. A requisição pode já ter chegado ao formulário.
+        """
+        if self.encerrando:
+            if asyncio.iscoroutine(envio):
+                envio.close()
+            return None
+
+        tarefa = asyncio.ensure_future(envio)
+        self._tarefas.add(tarefa)
+        try:
+            return await tarefa
+        except asyncio.CancelledError:
+            if tarefa in self._abortadas:
+                raise EnvioInterrompido() from None
+            raise
+        finally:
+            self._tarefas.discard(tarefa)
+            self._abortadas.discard(tarefa)
+
+    async def drenar(self, prazo: float) -> bool:
+        """
+        Recusa novos envios e aguarda os pendentes até o prazo
+
+        Envios que não terminarem dentro do prazo são abortados. A thread
+        da requisição não é interrompida, então o prazo deve ser maior que o
+        tempo máximo de um envio (ver TIMEOUT_ENVIO).
+
+        Args:
+            prazo: Tempo máximo de espera, em segundos
+
+        Returns:
+            bool: True se todos os envios terminaram dentro do prazo
+        """
+        self.encerrando = True
+        if not self._tarefas:
+            return True
+
+        logger.info(f"Aguardando {len(self._tarefas)} envio(s) em andamento (prazo: {prazo}s)")
+        _, pendentes = await asyncio.wait(set(self._tarefas), timeout=prazo)
+
+        for tarefa in pendentes:
+            self._abortadas.add(tarefa)
+            tarefa.cancel()
+
+        if pendentes:
+            logger.warning(f"{len(pendentes)} envio(s) abortado(s) pelo prazo de encerramento")
+        return not pendentes
+
+
+def criar_persistencia(caminho: str) -> PicklePersistence:
+    """
+    Cria a persistência usada para o snapshot de sessões
+
+    Apenas bot_data (rascunhos) e os estados de conversa são guardados, e o
+    arquivo só é gravado no desligamento.
+
+    Args:
+        caminho: Arquivo do snapshot
+    """
+    return PicklePersistence(
+        filepath=caminho,
+        store_data=PersistenceInput(bot_data=True, chat_data=False, user_data=False, callback_data=False),
+        on_flush=True,
+    )
+
+
+def restaurar_rascunhos(bot_data: Dict[str, Any], rascunhos: Dict[int, Dict[str, Any]]) -> int:
+    """
+    Restaura os rascunhos do snapshot e passa a guardá-los em bot_data
+
+    Args:
+        bot_data: bot_data da aplicação, já carregado da persistência
+        rascunhos: Armazenamento de rascunhos usado pelos handlers
+
+    Returns:
+        int: Quantidade de rascunhos restaurados
+    """
+    rascunhos.update(bot_data.get(CHAVE_RASCUNHOS) or {})
+    bot_data[CHAVE_RASCUNHOS] = rascunhos
+    return len(rascunhos)